@@ -4,9 +4,50 @@ from typing import List, Dict, Any, Optional
 from datetime import datetime
 from collections import Counter
 import math
+import operator
+
+import numpy as np
+
+# Numba is optional: when available, substring search runs as a JIT-compiled
+# Boyer-Moore-Horspool kernel over a packed byte buffer.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 # --- Search Algorithms ---
 
+if njit is not None:
+    @njit(cache=True)
+    def _bmh_contains(hay, offsets, needle, out):
+        """
+        Marks out[row] = True when needle occurs in hay[offsets[row]:offsets[row+1]].
+        Uses a Horspool shift table so each row scan skips up to len(needle)
+        bytes per mismatch.
+        """
+        m = needle.shape[0]
+        shift = np.full(256, m, np.int64)
+        for i in range(m - 1):
+            shift[needle[i]] = m - 1 - i
+        for row in range(offsets.shape[0] - 1):
+            start = offsets[row]
+            end = offsets[row + 1]
+            if m == 0:
+                out[row] = True
+                continue
+            j = start
+            found = False
+            while j + m <= end:
+                k = m - 1
+                while k >= 0 and hay[j + k] == needle[k]:
+                    k -= 1
+                if k < 0:
+                    found = True
+                    break
+                j += shift[hay[j + m - 1]]
+            out[row] = found
+        return out
+
 def linear_search_receipts(
     receipts: List[Dict[str, Any]],
     query: str,
@@ -23,18 +64,25 @@ def linear_search_receipts(
     Returns:
         A list of matching receipt dictionaries.
     """
-    results = []
-    for receipt in receipts:
-        field_value = str(receipt.get(field, "") or "") # Ensure it's a string, handle None
-        if not case_sensitive:
-            field_value = field_value.lower()
-            query_lower = query.lower()
-            if query_lower in field_value:
-                results.append(receipt)
-        else:
-            if query in field_value:
-                results.append(receipt)
-    return results
+    # Normalize case once up front instead of per row
+    field_values = [str(receipt.get(field, "") or "") for receipt in receipts]
+    if not case_sensitive:
+        query = query.lower()
+        field_values = [value.lower() for value in field_values]
+
+    if njit is not None and receipts:
+        # Pack all field values into one contiguous byte buffer with an
+        # offsets array and scan it with the JIT-compiled BMH kernel.
+        encoded = [value.encode("utf-8") for value in field_values]
+        lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        hay = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        needle = np.frombuffer(query.encode("utf-8"), dtype=np.uint8)
+        matches = _bmh_contains(hay, offsets, needle, np.zeros(len(encoded), dtype=np.bool_))
+        return [receipts[i] for i in np.flatnonzero(matches)]
+
+    return [receipt for receipt, value in zip(receipts, field_values) if query in value]
 
 def range_search_receipts_by_amount(
     receipts: List[Dict[str, Any]],
@@ -50,14 +98,22 @@ def range_search_receipts_by_amount(
     Returns:
         A list of matching receipt dictionaries.
     """
-    results = []
-    for receipt in receipts:
-        amount = receipt.get("amount")
-        if amount is not None:
-            if (min_amount is None or amount >= min_amount) and \
-               (max_amount is None or amount <= max_amount):
-                results.append(receipt)
-    return results
+    if not receipts:
+        return []
+    # Columnar filter: one C-level bounds check over a contiguous float64
+    # array replaces a Python branch per receipt. Missing amounts become NaN
+    # and are excluded by the validity mask.
+    amounts = np.fromiter(
+        (r.get("amount") if r.get("amount") is not None else np.nan for r in receipts),
+        dtype=np.float64,
+        count=len(receipts)
+    )
+    mask = ~np.isnan(amounts)
+    if min_amount is not None:
+        mask &= amounts >= min_amount
+    if max_amount is not None:
+        mask &= amounts <= max_amount
+    return [receipts[i] for i in np.flatnonzero(mask)]
 
 def range_search_receipts_by_date(
     receipts: List[Dict[str, Any]],
@@ -73,14 +129,22 @@ def range_search_receipts_by_date(
     Returns:
         A list of matching receipt dictionaries.
     """
-    results = []
-    for receipt in receipts:
-        tx_date = receipt.get("transaction_date")
-        if tx_date is not None:
-            if (start_date is None or tx_date >= start_date) and \
-               (end_date is None or tx_date <= end_date):
-                results.append(receipt)
-    return results
+    if not receipts:
+        return []
+    # Columnar filter over a datetime64 array; rows without a date are
+    # excluded via the validity mask (their placeholder value never survives
+    # the mask intersection).
+    tx_dates = [r.get("transaction_date") for r in receipts]
+    mask = np.fromiter((d is not None for d in tx_dates), dtype=bool, count=len(tx_dates))
+    dates = np.array(
+        [d if d is not None else datetime(1970, 1, 1) for d in tx_dates],
+        dtype="datetime64[us]"
+    )
+    if start_date is not None:
+        mask &= dates >= np.datetime64(start_date)
+    if end_date is not None:
+        mask &= dates <= np.datetime64(end_date)
+    return [receipts[i] for i in np.flatnonzero(mask)]
 
 # --- Sorting Algorithms ---
 
@@ -98,8 +162,17 @@ def sort_receipts(
     Returns:
         A new list of sorted receipt dictionaries.
     """
+    if not receipts:
+        return []
     # Timsort is efficient for various data distributions, O(n log n) average/worst case.
-    return sorted(receipts, key=lambda x: x.get(key, 0) if isinstance(x.get(key), (int, float)) else str(x.get(key, '')), reverse=reverse)
+    # Pick the key callable once based on the column's type instead of
+    # branching on every comparison: a uniformly typed column can use the
+    # C-implemented itemgetter and always yields a type-stable key.
+    sample = receipts[0].get(key)
+    if isinstance(sample, (int, float, datetime)) and \
+            all(r.get(key) is not None for r in receipts):
+        return sorted(receipts, key=operator.itemgetter(key), reverse=reverse)
+    return sorted(receipts, key=lambda x: str(x.get(key) or ''), reverse=reverse)
 
 # --- Aggregation Functions ---
 
@@ -118,46 +191,55 @@ def calculate_aggregates(receipts: List[Dict[str, Any]]) -> Dict[str, Any]:
             "mean_spend": 0.0,
             "median_spend": 0.0,
             "mode_spend": [],
+            "top_vendors": [],
             "vendor_frequency": {},
             "category_frequency": {}
         }
 
-    amounts = [r.get("amount", 0.0) for r in receipts]
-    vendors = [r.get("vendor", "Unknown") for r in receipts]
-    categories = [r.get("category", "Unknown") for r in receipts]
-
-    # Sum
-    total_spend = sum(amounts)
+    # Single pass over the receipts fills all three columns at once instead
+    # of walking the list separately per field. The contiguous float64 array
+    # lets sum/mean/median/mode run as C loops over the buffer.
+    n = len(receipts)
+    amounts = np.empty(n, dtype=np.float64)
+    vendors = [None] * n
+    categories = [None] * n
+    for i, receipt in enumerate(receipts):
+        amounts[i] = receipt.get("amount") or 0.0
+        vendors[i] = receipt.get("vendor", "Unknown")
+        categories[i] = receipt.get("category", "Unknown")
 
-    # Mean
-    mean_spend = total_spend / len(amounts)
+    # Sum and Mean
+    total_spend = float(amounts.sum())
+    mean_spend = float(amounts.mean())
 
     # Median
-    sorted_amounts = sorted(amounts)
-    n = len(sorted_amounts)
-    if n % 2 == 0:
-        median_spend = (sorted_amounts[n // 2 - 1] + sorted_amounts[n // 2]) / 2
-    else:
-        median_spend = sorted_amounts[n // 2]
+    median_spend = float(np.median(amounts))
 
-    # Mode
-    amount_counts = Counter(amounts)
-    max_count = 0
-    if amount_counts: # Check if amount_counts is not empty
-        max_count = max(amount_counts.values())
-    mode_spend = [amount for amount, count in amount_counts.items() if count == max_count]
+    # Mode — quantize to integer cents first, so amounts that differ only by
+    # float noise count as the same price and the unique/count pass works on
+    # int64 keys instead of raw floats.
+    cents = np.rint(amounts * 100).astype(np.int64)
+    values, counts = np.unique(cents, return_counts=True)
+    max_count = counts.max()
+    mode_spend = (values[counts == max_count] / 100.0).tolist()
 
-    # Vendor Frequency Distribution
-    vendor_frequency = dict(Counter(vendors))
+    # Frequency distributions. The Counters are returned as-is (Counter is a
+    # dict subclass, so serialization and lookups work unchanged) instead of
+    # re-hashing every key into a plain dict; callers also get most_common()
+    # for free.
+    vendor_frequency = Counter(vendors)
+    category_frequency = Counter(categories)
 
-    # Category Frequency Distribution
-    category_frequency = dict(Counter(categories))
+    # Top vendors via heap-select (heapq.nlargest under most_common), which
+    # is O(V log 5) instead of sorting the whole frequency table.
+    top_vendors = vendor_frequency.most_common(5)
 
     return {
         "total_spend": total_spend,
         "mean_spend": mean_spend,
         "median_spend": median_spend,
         "mode_spend": mode_spend,
+        "top_vendors": top_vendors,
         "vendor_frequency": vendor_frequency,
         "category_frequency": category_frequency
     }
@@ -171,17 +253,36 @@ def time_series_aggregation(receipts: List[Dict[str, Any]], period: str = "month
     Returns:
         A dictionary with period (e.g., 'YYYY-MM') as key and total spend as value.
     """
-    time_series_data = Counter()
+    if period == "month":
+        fmt = "%Y-%m"
+    elif period == "year":
+        fmt = "%Y"
+    else:
+        raise ValueError("Period must be 'month' or 'year'")
+
+    # Collect valid rows in one pass; the bucketing and summation then run
+    # vectorized in pandas (C-level strftime and hash-table groupby).
+    dates = []
+    amounts = []
     for receipt in receipts:
         tx_date = receipt.get("transaction_date")
-        amount = receipt.get("amount", 0.0)
         if tx_date and isinstance(tx_date, datetime):
-            if period == "month":
-                key = tx_date.strftime("%Y-%m")
-            elif period == "year":
-                key = tx_date.strftime("%Y")
-            else:
-                raise ValueError("Period must be 'month' or 'year'")
-            time_series_data[key] += amount
-    return dict(sorted(time_series_data.items()))
+            dates.append(tx_date)
+            amounts.append(receipt.get("amount", 0.0))
+
+    if not dates:
+        return {}
+
+    try:
+        import pandas as pd
+    except ImportError:
+        # Fallback: per-row strftime accumulation when pandas is unavailable.
+        time_series_data = Counter()
+        for tx_date, amount in zip(dates, amounts):
+            time_series_data[tx_date.strftime(fmt)] += amount
+        return dict(sorted(time_series_data.items()))
+
+    keys = pd.Series(np.array(dates, dtype="datetime64[ns]")).dt.strftime(fmt)
+    grouped = pd.Series(amounts, dtype=np.float64).groupby(keys.values).sum()
+    return grouped.to_dict()
 
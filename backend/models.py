@@ -24,6 +24,19 @@ class ReceiptOut(ReceiptCreate):
     id: int
     uploaded_at: datetime
 
+# Pydantic model for listing receipts without the bulky extracted_text field
+class ReceiptSummary(BaseModel):
+    id: int
+    filename: str
+    vendor: str
+    transaction_date: datetime
+    amount: float
+    category: Optional[str] = None
+    uploaded_at: datetime
+
+    class Config:
+        from_attributes = True
+
 # Pydantic model for updating receipt data (all fields are optional)
 class ReceiptUpdate(BaseModel):
     vendor: Optional[str] = None
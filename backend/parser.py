@@ -2,12 +2,22 @@
 
 import os
 import re
+import json
+import hashlib
+import numpy as np
 from PIL import Image
 import pytesseract
 from datetime import datetime
 from typing import Optional, Dict, Any
 import logging
 
+# pyahocorasick is optional: when available, category keywords are matched in
+# a single automaton pass over the text instead of one scan per keyword.
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -20,26 +30,161 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def save_uploaded_file(file_content: bytes, filename: str) -> str:
-    """Saves the uploaded file to the UPLOAD_DIR."""
+# On-disk cache of parse results keyed by content digest, so re-uploading the
+# same bytes (common while testing) skips the OCR + parsing pipeline.
+PARSE_CACHE_DIR = os.path.join(UPLOAD_DIR, ".parse_cache")
+os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+
+# Pre-compiled patterns. Compiling once at import time avoids re-building the
+# regex state machines on every upload, and unioning the alternatives lets a
+# single pass over the text replace several sequential scans.
+#
+# The letter patterns are written lowercase and matched against a text that is
+# lowercased once per receipt, instead of re.IGNORECASE case-folding every
+# candidate position in every pattern.
+_VENDOR_RE = re.compile(
+    r"supermarket|groceries|store|shop|cafe|restaurant|pharmacy|utility|internet|electricity"
+    r"|walmart|target|kroger|amazon|starbucks|local cafe|best buy|vodafone|reliance jio|bescom"
+)
+
+# Lines that look like a bare date or amount (used to skip them as vendor candidates)
+_VENDOR_SKIP_RE = re.compile(r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}$|^\d+\.\d{2}$')
+
+# Common date formats: DD/MM/YYYY, MM/DD/YYYY, YYYY-MM-DD, DD-MMM-YYYY
+# (strptime is case-insensitive for month names, so lowercase input is fine)
+#
+# Each pattern carries the only strptime formats it can actually produce
+# (separators are normalized to '/' before parsing), so a match costs at most
+# two parse attempts instead of an exception-driven walk of ten formats.
+_DATE_PATTERNS = [
+    (re.compile(r'\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}'), ("%d/%m/%Y", "%m/%d/%Y")),  # DD/MM/YYYY, MM/DD/YYYY
+    (re.compile(r'\d{4}[-/.]\d{1,2}[-/.]\d{1,2}'), ("%Y/%m/%d",)),  # YYYY-MM-DD
+    (re.compile(r'\b\d{1,2}\s+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s+\d{2,4}\b'), ("%d %b %Y", "%d %B %Y")), # DD Mon YYYY
+    (re.compile(r'\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s+\d{1,2},\s+\d{2,4}\b'), ("%b %d, %Y", "%B %d, %Y")) # Mon DD, YYYY
+]
+
+# Amount patterns, in priority order (total/balance lines first)
+_AMOUNT_RES = [
+    re.compile(r'(?:total|amount|balance|due)\s*[:]?\s*[\$€£₹]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))'), # e.g., TOTAL: $123.45 or TOTAL 123,45
+    re.compile(r'[\$€£₹]\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))'), # e.g., $123.45
+    re.compile(r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))\s*(?:inr|usd|eur|gbp)'), # e.g., 123.45 USD
+    re.compile(r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))\s*$', re.MULTILINE) # Number at the end of a line
+]
+
+# Category keywords unioned into one alternation; the matched group index
+# tells us which category fired (first occurrence in the text wins).
+_CATEGORY_RE = re.compile(
+    r"(grocer|supermarket|food)|(electric|power|utility)|(internet|broadband|telecom)"
+    r"|(restaurant|cafe|dine)|(pharmacy|medicine|health)"
+)
+_CATEGORY_BY_GROUP = {
+    1: "Groceries",
+    2: "Utilities",
+    3: "Internet/Telecom",
+    4: "Dining",
+    5: "Health"
+}
+
+_CATEGORY_KEYWORDS = [
+    ("grocer", "Groceries"), ("supermarket", "Groceries"), ("food", "Groceries"),
+    ("electric", "Utilities"), ("power", "Utilities"), ("utility", "Utilities"),
+    ("internet", "Internet/Telecom"), ("broadband", "Internet/Telecom"), ("telecom", "Internet/Telecom"),
+    ("restaurant", "Dining"), ("cafe", "Dining"), ("dine", "Dining"),
+    ("pharmacy", "Health"), ("medicine", "Health"), ("health", "Health")
+]
+
+if ahocorasick is not None:
+    _CATEGORY_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _category in _CATEGORY_KEYWORDS:
+        _CATEGORY_AUTOMATON.add_word(_keyword, _category)
+    _CATEGORY_AUTOMATON.make_automaton()
+else:
+    _CATEGORY_AUTOMATON = None
+
+def save_uploaded_file(src, filename: str, chunk_size: int = 1 << 20):
+    """
+    Streams an uploaded file object to the UPLOAD_DIR in chunks, so large
+    uploads never have to be buffered fully in memory. Each chunk is also fed
+    to a blake2b hasher, and the content digest is returned alongside the
+    path for use as a parse-cache key.
+    """
     file_path = os.path.join(UPLOAD_DIR, filename)
+    hasher = hashlib.blake2b(digest_size=16)
     try:
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        with open(file_path, "wb") as dst:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                dst.write(chunk)
         logging.info(f"File saved successfully: {file_path}")
-        return file_path
+        return file_path, hasher.hexdigest()
     except IOError as e:
         logging.error(f"Error saving file {filename}: {e}")
         raise
 
+def load_cached_parse(digest: str) -> Optional[Dict[str, Any]]:
+    """Returns the cached parse result for a content digest, or None."""
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{digest}.json")
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        cached["transaction_date"] = datetime.fromisoformat(cached["transaction_date"])
+        logging.info(f"Parse cache hit for digest {digest}.")
+        return cached
+    except (OSError, ValueError, KeyError, TypeError):
+        # A corrupt cache entry just means we re-run the pipeline
+        return None
+
+def store_cached_parse(digest: str, parsed_data: Dict[str, Any]) -> None:
+    """Stores a parse result in the on-disk cache keyed by content digest."""
+    payload = dict(parsed_data)
+    payload["transaction_date"] = payload["transaction_date"].isoformat()
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{digest}.json")
+    try:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+    except OSError as e:
+        logging.warning(f"Could not write parse cache entry {digest}: {e}")
+
+# Long-edge cap for OCR input; Tesseract cost scales with pixel count, and a
+# 4000x3000 phone photo carries far more pixels than the LSTM needs.
+_MAX_OCR_DIMENSION = 2000
+
+def _otsu_threshold(pixels: np.ndarray) -> int:
+    """Finds the Otsu binarization threshold for a grayscale pixel array."""
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weight_bg = np.cumsum(histogram)
+    weight_fg = pixels.size - weight_bg
+    cum_sum = np.cumsum(histogram * np.arange(256))
+    valid = (weight_bg > 0) & (weight_fg > 0)
+    mean_bg = np.divide(cum_sum, weight_bg, out=np.zeros(256), where=valid)
+    mean_fg = np.divide(cum_sum[-1] - cum_sum, weight_fg, out=np.zeros(256), where=valid)
+    between_class_variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+    between_class_variance[~valid] = 0.0
+    return int(np.argmax(between_class_variance))
+
 def extract_text_from_image(image_path: str) -> str:
     """Extracts text from an image using Tesseract OCR."""
     try:
         img = Image.open(image_path)
         # Convert image to grayscale for better OCR performance
         img = img.convert('L')
+        # Downscale oversized photos: fewer pixels means proportionally less
+        # OCR work with no accuracy loss at receipt print sizes
+        width, height = img.size
+        scale = min(1.0, _MAX_OCR_DIMENSION / max(width, height))
+        if scale < 1.0:
+            img = img.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
+        # Otsu binarization gives Tesseract a clean black/white image
+        pixels = np.asarray(img)
+        threshold = _otsu_threshold(pixels)
+        img = Image.fromarray((pixels > threshold).astype(np.uint8) * 255)
         # Use a specific language if needed, e.g., lang='eng+deu'
-        text = pytesseract.image_to_string(img, lang='eng')
+        text = pytesseract.image_to_string(img, lang='eng', config='--oem 1 --psm 6')
         logging.info(f"Text extracted from {os.path.basename(image_path)}.")
         return text
     except pytesseract.TesseractNotFoundError:
@@ -59,55 +204,43 @@ def parse_receipt_text(text: str) -> Dict[str, Any]:
     amount = 0.01 # Default to a small non-zero value to pass Pydantic validation
     category = None
 
+    # Case-fold the whole text once; all keyword patterns below are written
+    # lowercase, so nothing re-folds per comparison. The original text is
+    # kept for the extracted_text field and vendor-casing recovery.
+    text_lower = text.lower()
+
     # --- Vendor Extraction (simple example) ---
     # Look for common keywords or assume first non-date/amount line
     # This is highly dependent on receipt format.
-    vendor_patterns = [
-        r"(?i)supermarket|groceries|store|shop|cafe|restaurant|pharmacy|utility|internet|electricity",
-        r"Walmart|Target|Kroger|Amazon|Starbucks|Local Cafe|Best Buy|Vodafone|Reliance Jio|BESCOM", # Specific vendors
-    ]
-    for pattern in vendor_patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
-        if match:
-            vendor = match.group(0).strip()
-            break
-    
+    match = _VENDOR_RE.search(text_lower)
+    if match:
+        # Slice the original text by the match span to keep the casing
+        vendor = text[match.start():match.end()].strip()
+
     # Fallback: take the first non-empty line that doesn't look like a date or amount
     lines = [line.strip() for line in text.split('\n') if line.strip()]
     if lines:
         for line in lines:
             # Skip lines that are too short/long, or look like dates/amounts
-            if not re.search(r'^\d{1,2}[/-]\d{1,2}[/-]\d{2,4}$|^\d+\.\d{2}$', line) and \
-               3 < len(line) < 30:
+            if not _VENDOR_SKIP_RE.search(line) and 3 < len(line) < 30:
                 vendor = line
                 break
 
 
     # --- Date Extraction ---
-    # Common date formats: DD/MM/YYYY, MM/DD/YYYY, YYYY-MM-DD, DD-MMM-YYYY
-    date_patterns = [
-        r'\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}',  # DD/MM/YYYY, MM/DD/YYYY
-        r'\d{4}[-/.]\d{1,2}[-/.]\d{1,2}',  # YYYY-MM-DD
-        r'\b\d{1,2}\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\w*\s+\d{2,4}\b', # DD Mon YYYY
-        r'\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\w*\s+\d{1,2},\s+\d{2,4}\b' # Mon DD, YYYY
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text)
-        if match:
-            date_str = match.group(0)
+    for pattern, formats in _DATE_PATTERNS:
+        match = pattern.search(text_lower)
+        if not match:
+            continue
+        date_str = match.group(0).replace('-', '/').replace('.', '/')
+        for fmt in formats:
             try:
-                # Try parsing common formats
-                for fmt in ["%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d", "%d-%m-%Y", "%d.%m.%Y", "%m.%d.%Y",
-                            "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y"]:
-                    try:
-                        transaction_date = datetime.strptime(date_str, fmt)
-                        break
-                    except ValueError:
-                        continue
-                if transaction_date:
-                    break
-            except Exception:
-                pass # Continue to next pattern/format
+                transaction_date = datetime.strptime(date_str, fmt)
+                break
+            except ValueError:
+                continue
+        if transaction_date:
+            break
 
     # Fallback to current date if no date found
     if transaction_date is None:
@@ -117,18 +250,9 @@ def parse_receipt_text(text: str) -> Dict[str, Any]:
     # --- Amount Extraction ---
     # Prioritize lines containing "TOTAL", "BALANCE", "AMOUNT DUE"
     # Look for patterns like currency symbol followed by number, or number followed by currency code
-    # Regex: (?:[Tt][Oo][Tt][Aa][Ll]|[Bb][Aa][Ll][Aa][Nn][Cc][Ee]|[Dd][Uu][Ee])\s*[:]?\s*[\$€£₹]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))
-    # This looks for "Total", "Balance", "Due" (case-insensitive), optional colon, optional currency symbol, then the number.
-    amount_patterns = [
-        r'(?:TOTAL|AMOUNT|BALANCE|DUE)\s*[:]?\s*[\$€£₹]?\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))', # e.g., TOTAL: $123.45 or TOTAL 123,45
-        r'[\$€£₹]\s*(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))', # e.g., $123.45
-        r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))\s*(?:INR|USD|EUR|GBP)', # e.g., 123.45 USD
-        r'(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{1,2}))\s*$' # Number at the end of a line
-    ]
-    
     found_amount = False
-    for pattern in amount_patterns:
-        matches = re.findall(pattern, text, re.IGNORECASE)
+    for pattern in _AMOUNT_RES:
+        matches = pattern.findall(text_lower)
         if matches:
             # Take the last found amount, as it's often the total
             raw_amount = matches[-1]
@@ -149,19 +273,12 @@ def parse_receipt_text(text: str) -> Dict[str, Any]:
 
     # --- Category Mapping (simple rule-based) ---
     # This can be expanded with a proper mapping dictionary or ML model
-    text_lower = text.lower()
-    if "grocer" in text_lower or "supermarket" in text_lower or "food" in text_lower:
-        category = "Groceries"
-    elif "electric" in text_lower or "power" in text_lower or "utility" in text_lower:
-        category = "Utilities"
-    elif "internet" in text_lower or "broadband" in text_lower or "telecom" in text_lower:
-        category = "Internet/Telecom"
-    elif "restaurant" in text_lower or "cafe" in text_lower or "dine" in text_lower:
-        category = "Dining"
-    elif "pharmacy" in text_lower or "medicine" in text_lower or "health" in text_lower:
-        category = "Health"
+    if _CATEGORY_AUTOMATON is not None:
+        # Single Aho-Corasick pass over the text; first keyword hit wins.
+        category = next((cat for _, cat in _CATEGORY_AUTOMATON.iter(text_lower)), "Miscellaneous")
     else:
-        category = "Miscellaneous"
+        match = _CATEGORY_RE.search(text_lower)
+        category = _CATEGORY_BY_GROUP[match.lastindex] if match else "Miscellaneous"
 
 
     logging.info(f"Parsed data: Vendor='{vendor}', Date='{transaction_date}', Amount={amount}, Category='{category}'")
@@ -1,10 +1,9 @@
 # frontend/app.py
 
+import time
+import orjson
 import streamlit as st
 import requests
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 from datetime import datetime
 from io import BytesIO
 
@@ -22,44 +21,126 @@ st.title("🧾 Receipt & Bill Analyzer")
 st.markdown("Upload your receipts and bills to extract data and get insights!")
 
 # --- Helper Functions for API Calls ---
+@st.cache_resource
+def _http_session():
+    """
+    One pooled requests.Session per worker. Keep-alive connections avoid a
+    fresh TCP handshake on every API call.
+    """
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = _http_session()
+
 def upload_file_to_backend(file):
-    """Sends the file to the backend for upload and processing."""
-    files = {"file": (file.name, file.getvalue(), file.type)}
+    """
+    Sends the file to the backend and polls the background task until OCR
+    and parsing finish. The upload request itself returns in milliseconds;
+    the slow work happens off the request path.
+    """
+    # Hand the file object itself to requests so the body streams in chunks;
+    # getvalue() would materialize the whole upload as bytes first.
+    file.seek(0)
+    files = {"file": (file.name, file, file.type)}
     try:
-        response = requests.post(f"{BACKEND_URL}/upload-receipt/", files=files)
+        response = SESSION.post(f"{BACKEND_URL}/upload-receipt/", files=files)
         response.raise_for_status() # Raise an exception for HTTP errors
-        return response.json()
+        task_id = response.json()["task_id"]
+        # Cap the wait: a backend restart loses the in-memory task table, so
+        # the poll 404s (caught below via raise_for_status) rather than
+        # spinning forever, and a stuck task gives up after the deadline.
+        deadline = time.monotonic() + 120
+        with st.status("Processing receipt...", expanded=False):
+            while True:
+                response = SESSION.get(f"{BACKEND_URL}/tasks/{task_id}")
+                response.raise_for_status()
+                task = response.json()
+                if task.get("done"):
+                    break
+                if time.monotonic() >= deadline:
+                    st.error("Timed out waiting for the receipt to finish processing.")
+                    return None
+                time.sleep(0.5)
+        if task.get("error"):
+            st.error(f"Error processing file: {task['error']}")
+            return None
+        _invalidate_fetch_caches()
+        return task.get("receipt")
     except requests.exceptions.RequestException as e:
         st.error(f"Error uploading file: {e}")
         if response is not None:
             st.error(f"Backend response: {response.text}")
         return None
 
-def fetch_all_receipts():
-    """Fetches all receipts from the backend."""
+def _fetch_json(path, params=None):
+    """
+    Issues one GET on the pooled session and returns the decoded body.
+    The session negotiates gzip transparently; orjson then parses the
+    decompressed bytes noticeably faster than the stdlib decoder on the
+    large receipts payloads.
+    """
+    response = SESSION.get(f"{BACKEND_URL}{path}", params=params)
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+RECEIPTS_PAGE_SIZE = 50
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_all_receipts(offset: int = 0, limit: int = RECEIPTS_PAGE_SIZE):
+    """Fetches one page of receipts from the backend."""
     try:
-        response = requests.get(f"{BACKEND_URL}/receipts/")
-        response.raise_for_status()
-        return response.json()
+        return _fetch_json("/receipts/", params={"offset": offset, "limit": limit})
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching receipts: {e}")
         return []
 
+@st.cache_data(ttl=30, show_spinner=False)
 def fetch_insights():
     """Fetches aggregated insights from the backend."""
     try:
-        response = requests.get(f"{BACKEND_URL}/insights/")
-        response.raise_for_status()
-        return response.json()
+        return _fetch_json("/insights/")
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching insights: {e}")
         return {}
 
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_dashboard():
+    """
+    Fetches the combined receipts + insights payload from the batched
+    /dashboard/ endpoint — one round-trip instead of two.
+    """
+    try:
+        dashboard = _fetch_json("/dashboard/")
+        return dashboard.get("receipts", []), dashboard.get("insights", {})
+    except requests.exceptions.RequestException as e:
+        st.error(f"Error fetching dashboard data: {e}")
+        return [], {}
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def fetch_image_bytes(url: str) -> bytes:
+    """
+    Downloads the receipt image once per URL; reruns within the expander
+    reuse the cached bytes instead of re-fetching from the backend.
+    """
+    response = SESSION.get(url)
+    response.raise_for_status()
+    return response.content
+
+def _invalidate_fetch_caches():
+    """Drops the cached backend data after a successful mutation."""
+    fetch_all_receipts.clear()
+    fetch_insights.clear()
+    fetch_dashboard.clear()
+
 def update_receipt_in_backend(receipt_id, data):
     """Updates a receipt in the backend."""
     try:
-        response = requests.put(f"{BACKEND_URL}/receipts/{receipt_id}", json=data)
+        response = SESSION.put(f"{BACKEND_URL}/receipts/{receipt_id}", json=data)
         response.raise_for_status()
+        _invalidate_fetch_caches()
         return response.json()
     except requests.exceptions.RequestException as e:
         st.error(f"Error updating receipt {receipt_id}: {e}")
@@ -68,13 +149,40 @@ def update_receipt_in_backend(receipt_id, data):
 def delete_receipt_from_backend(receipt_id):
     """Deletes a receipt from the backend."""
     try:
-        response = requests.delete(f"{BACKEND_URL}/receipts/{receipt_id}")
+        response = SESSION.delete(f"{BACKEND_URL}/receipts/{receipt_id}")
         response.raise_for_status()
+        _invalidate_fetch_caches()
         return True
     except requests.exceptions.RequestException as e:
         st.error(f"Error deleting receipt {receipt_id}: {e}")
         return False
 
+# --- Cached Figure Builders ---
+# Only the pie chart still needs matplotlib (no native Streamlit
+# equivalent); it is keyed on a hashable data tuple, so reruns with
+# unchanged insights skip Figure/Artist construction entirely. The other
+# charts render client-side via Streamlit's native Vega-Lite elements.
+@st.cache_data(show_spinner=False)
+def _category_figure(category_rows: tuple):
+    # matplotlib is imported lazily: only the Insights page pays its
+    # import cost, and only on a cache miss.
+    import matplotlib.pyplot as plt
+
+    # Feed the label/count sequences to ax.pie directly; building a
+    # DataFrame here would only add an index and a copy of the values.
+    labels = [category for category, _ in category_rows]
+    counts = [count for _, count in category_rows]
+    fig, ax = plt.subplots(figsize=(10, 6), constrained_layout=True)
+    # Use autopct to show percentage on pie chart slices
+    ax.pie(counts, labels=labels, autopct='%1.1f%%', startangle=90, colors=plt.get_cmap("Pastel1").colors)
+    ax.axis('equal') # Equal aspect ratio ensures that pie is drawn as a circle.
+    ax.set_title("Expenditure by Category")
+    # Drop the figure from pyplot's global registry immediately: the cache
+    # keeps the Figure object alive for st.pyplot, and the registry would
+    # otherwise accumulate one figure per rerun in long sessions.
+    plt.close(fig)
+    return fig
+
 # --- Sidebar for Navigation ---
 st.sidebar.header("Navigation")
 page = st.sidebar.radio("Go to", ["Upload & View", "Insights & Analytics"])
@@ -89,25 +197,35 @@ if page == "Upload & View":
     )
 
     if uploaded_file is not None:
-        with st.spinner("Processing file... This may take a moment."):
-            result = upload_file_to_backend(uploaded_file)
-            if result:
-                st.success("File uploaded and processed successfully!")
-                st.json(result) # Show raw parsed data for debugging
-                st.write("---")
-            else:
-                st.error("Failed to process the uploaded file.")
+        # upload_file_to_backend shows its own st.status while the backend
+        # task runs, so no extra spinner is needed here.
+        result = upload_file_to_backend(uploaded_file)
+        if result:
+            st.success("File uploaded and processed successfully!")
+            st.json(result) # Show raw parsed data for debugging
+            st.write("---")
+        else:
+            st.error("Failed to process the uploaded file.")
 
     st.header("All Uploaded Receipts")
 
-    # Fetch and display receipts
-    receipts_data = fetch_all_receipts()
+    # Server-side pagination: only the current page crosses the wire and is
+    # serialized to the browser, so render cost stays flat as uploads grow.
+    page_number = st.number_input("Page", min_value=0, value=0, step=1)
+    receipts_data = fetch_all_receipts(offset=page_number * RECEIPTS_PAGE_SIZE)
 
     if receipts_data:
-        # Convert transaction_date and uploaded_at strings to datetime objects for proper display/sorting
-        df = pd.DataFrame(receipts_data)
-        df["transaction_date"] = pd.to_datetime(df["transaction_date"])
-        df["uploaded_at"] = pd.to_datetime(df["uploaded_at"])
+        # Deferred import: uploads and the empty state never pay for pandas.
+        # Python caches the module, so later reruns rebind it for free.
+        import pandas as pd
+
+        # Build the frame with explicit dtypes (skips per-row type inference;
+        # 'category' also compresses the repeated strings) and parse the
+        # datetime columns via pandas' ISO8601 fast path.
+        df = pd.DataFrame.from_records(receipts_data)
+        df = df.astype({"id": "int64", "vendor": "string", "category": "category", "amount": "float64"})
+        df["transaction_date"] = pd.to_datetime(df["transaction_date"], format="ISO8601", utc=True)
+        df["uploaded_at"] = pd.to_datetime(df["uploaded_at"], format="ISO8601", utc=True)
 
         # Display tabular view
         st.subheader("Tabular View of Receipts")
@@ -115,17 +233,20 @@ if page == "Upload & View":
 
         # Manual Correction / Edit Feature
         st.subheader("Edit/Delete Receipt")
-        receipt_ids = [r['id'] for r in receipts_data]
+        # Index once: every widget interaction reruns this block, so lookups
+        # should be O(1) hashes rather than linear scans of the list.
+        receipts_by_id = {r['id']: r for r in receipts_data}
+        receipt_ids = list(receipts_by_id)
         if receipt_ids:
             selected_id = st.selectbox("Select Receipt ID to Edit/Delete", receipt_ids)
-            selected_receipt = next((r for r in receipts_data if r['id'] == selected_id), None)
+            selected_receipt = receipts_by_id.get(selected_id)
 
             if selected_receipt:
                 with st.expander(f"Edit Receipt ID: {selected_id}"):
                     # Display original file if it's an image
                     if selected_receipt['filename'].lower().endswith(('.png', '.jpg', '.jpeg')):
                         file_url = f"{BACKEND_URL}/uploads/{selected_receipt['filename']}"
-                        st.image(file_url, caption=f"Original File: {selected_receipt['filename']}", use_column_width=True)
+                        st.image(fetch_image_bytes(file_url), caption=f"Original File: {selected_receipt['filename']}", use_column_width=True)
                     else:
                         st.info(f"Original file: {selected_receipt['filename']}")
 
@@ -134,11 +255,10 @@ if page == "Upload & View":
                     new_amount = col2.number_input("Amount", value=float(selected_receipt['amount']), format="%.2f", key=f"amount_{selected_id}")
 
                     col3, col4 = st.columns(2)
-                    # Convert datetime to date for date_input widget
-                    tx_date_dt = selected_receipt['transaction_date']
-                    if isinstance(tx_date_dt, str):
-                        tx_date_dt = datetime.fromisoformat(tx_date_dt.replace('Z', '+00:00')) # Handle 'Z' for UTC
-                    new_transaction_date = col3.date_input("Transaction Date", value=tx_date_dt.date(), key=f"date_{selected_id}")
+                    # Convert to date for the date_input widget; pd.Timestamp
+                    # parses ISO8601 (including 'Z') in C, no manual fixup.
+                    tx_date = pd.Timestamp(selected_receipt['transaction_date']).date()
+                    new_transaction_date = col3.date_input("Transaction Date", value=tx_date, key=f"date_{selected_id}")
                     new_category = col4.text_input("Category", value=selected_receipt['category'], key=f"category_{selected_id}")
 
                     if st.button(f"Save Changes for ID {selected_id}", key=f"save_{selected_id}"):
@@ -150,15 +270,17 @@ if page == "Upload & View":
                         }
                         updated_receipt = update_receipt_in_backend(selected_id, update_data)
                         if updated_receipt:
+                            # The button click already triggered this rerun and the
+                            # update helper cleared the fetch caches, so the next
+                            # natural cycle renders fresh data without forcing a
+                            # second full script execution.
                             st.success(f"Receipt ID {selected_id} updated successfully!")
-                            st.experimental_rerun() # Rerun to refresh the list
 
                 if st.button(f"Delete Receipt ID {selected_id}", key=f"delete_{selected_id}", type="secondary"):
                     if st.warning(f"Are you sure you want to delete receipt ID {selected_id}? This action cannot be undone."):
                         if st.button("Confirm Delete", key=f"confirm_delete_{selected_id}"):
                             if delete_receipt_from_backend(selected_id):
                                 st.success(f"Receipt ID {selected_id} deleted successfully.")
-                                st.experimental_rerun() # Rerun to refresh the list
                             else:
                                 st.error(f"Failed to delete receipt ID {selected_id}.")
         else:
@@ -168,80 +290,66 @@ if page == "Upload & View":
         st.info("No receipts found. Upload one to get started!")
 
 elif page == "Insights & Analytics":
+    # Deferred import, same as the receipts table: the heavy module only
+    # loads once this page is opened.
+    import pandas as pd
+
     st.header("Statistical Insights & Visualizations")
 
-    insights = fetch_insights()
+    receipts_data, insights = fetch_dashboard()
 
     if insights:
+        # Count from the aggregates, not the paginated receipts list — the
+        # dashboard payload carries at most one page of rows.
+        st.caption(f"Based on {insights.get('receipt_count', 0)} receipts.")
         st.subheader("Overall Summary")
         col1, col2, col3 = st.columns(3)
         col1.metric("Total Spend", f"₹{insights.get('total_spend', 0):,.2f}")
         col2.metric("Average Spend", f"₹{insights.get('mean_spend', 0):,.2f}")
         col3.metric("Median Spend", f"₹{insights.get('median_spend', 0):,.2f}")
-        st.write(f"**Mode Spend:** {', '.join([f'₹{m:,.2f}' for m in insights.get('mode_spend', [])])}")
+        st.write(f"**Mode Spend:** {', '.join(f'₹{m:,.2f}' for m in insights.get('mode_spend', []))}")
 
         st.subheader("Top Vendors")
-        top_vendors_df = pd.DataFrame(insights.get("top_vendors", []), columns=["Vendor", "Count"])
-        if not top_vendors_df.empty:
+        top_vendor_rows = tuple(map(tuple, insights.get("top_vendors", [])))
+        if top_vendor_rows:
+            top_vendors_df = pd.DataFrame(top_vendor_rows, columns=["Vendor", "Count"])
             st.dataframe(top_vendors_df, hide_index=True)
-            fig_vendor, ax_vendor = plt.subplots(figsize=(10, 6))
-            sns.barplot(x="Count", y="Vendor", data=top_vendors_df, ax=ax_vendor, palette="viridis")
-            ax_vendor.set_title("Top Vendors by Frequency")
-            ax_vendor.set_xlabel("Number of Receipts")
-            ax_vendor.set_ylabel("Vendor")
-            st.pyplot(fig_vendor)
+            # Native chart: ships the data as JSON and renders in the
+            # browser instead of rasterizing a PNG server-side
+            st.bar_chart(top_vendors_df.set_index("Vendor"))
         else:
             st.info("No vendor data to display.")
 
         st.subheader("Category Distribution")
         category_dist = insights.get("category_distribution", {})
         if category_dist:
-            category_df = pd.DataFrame(list(category_dist.items()), columns=["Category", "Count"])
+            category_rows = tuple(category_dist.items())
+            # Series ingests the dict directly (keys become the index), so no
+            # intermediate list of tuples is materialized for the table.
+            category_df = pd.Series(category_dist, name="Count").rename_axis("Category").reset_index()
             st.dataframe(category_df, hide_index=True)
-
-            fig_category, ax_category = plt.subplots(figsize=(10, 6))
-            # Use autopct to show percentage on pie chart slices
-            ax_category.pie(category_df["Count"], labels=category_df["Category"], autopct='%1.1f%%', startangle=90, colors=sns.color_palette("pastel"))
-            ax_category.axis('equal') # Equal aspect ratio ensures that pie is drawn as a circle.
-            ax_category.set_title("Expenditure by Category")
-            st.pyplot(fig_category)
+            st.pyplot(_category_figure(category_rows))
         else:
             st.info("No category data to display.")
 
 
         st.subheader("Monthly Spend Trend")
-        monthly_trend = insights.get("monthly_spend_trend", {})
+        monthly_trend = insights.get("monthly_spend_trend", [])
         if monthly_trend:
-            monthly_df = pd.DataFrame(list(monthly_trend.items()), columns=["Month", "Spend"])
-            monthly_df["Month"] = pd.to_datetime(monthly_df["Month"]) # Convert to datetime for proper sorting
-            monthly_df = monthly_df.sort_values("Month")
-
-            fig_monthly, ax_monthly = plt.subplots(figsize=(12, 6))
-            sns.lineplot(x="Month", y="Spend", data=monthly_df, marker='o', ax=ax_monthly, color='skyblue')
-            ax_monthly.set_title("Monthly Expenditure Trend")
-            ax_monthly.set_xlabel("Month")
-            ax_monthly.set_ylabel("Total Spend (₹)")
-            ax_monthly.tick_params(axis='x', rotation=45)
-            ax_monthly.grid(True, linestyle='--', alpha=0.7)
-            st.pyplot(fig_monthly)
+            # The backend emits ascending [month, total] pairs, so no
+            # client-side sort is needed
+            monthly_df = pd.DataFrame(monthly_trend, columns=["Month", "Spend"])
+            monthly_df["Month"] = pd.to_datetime(monthly_df["Month"], format="%Y-%m")
+            st.line_chart(monthly_df.set_index("Month"))
         else:
             st.info("No monthly spend data to display.")
 
         st.subheader("Yearly Spend Trend")
-        yearly_trend = insights.get("yearly_spend_trend", {})
+        yearly_trend = insights.get("yearly_spend_trend", [])
         if yearly_trend:
-            yearly_df = pd.DataFrame(list(yearly_trend.items()), columns=["Year", "Spend"])
-            yearly_df["Year"] = pd.to_datetime(yearly_df["Year"], format="%Y") # Convert to datetime for proper sorting
-            yearly_df = yearly_df.sort_values("Year")
-
-            fig_yearly, ax_yearly = plt.subplots(figsize=(10, 6))
-            sns.lineplot(x="Year", y="Spend", data=yearly_df, marker='o', ax=ax_yearly, color='lightcoral')
-            ax_yearly.set_title("Yearly Expenditure Trend")
-            ax_yearly.set_xlabel("Year")
-            ax_yearly.set_ylabel("Total Spend (₹)")
-            ax_yearly.tick_params(axis='x', rotation=45)
-            ax_yearly.grid(True, linestyle='--', alpha=0.7)
-            st.pyplot(fig_yearly)
+            yearly_df = pd.DataFrame(yearly_trend, columns=["Year", "Spend"])
+            yearly_df["Year"] = pd.to_datetime(yearly_df["Year"], format="%Y")
+            st.line_chart(yearly_df.set_index("Year"))
         else:
             st.info("No yearly spend data to display.")
 